@@ -50,6 +50,16 @@ log "Step 3: Adding private subnet to VPC 1"
 sudo python3 $VPCCTL add-subnet vpc1 private-subnet 10.0.2.0/24 --type private
 sleep 1
 
+log "Step 3b: Adding /32 subnet to VPC 1 (edge-case prefix)"
+sudo python3 $VPCCTL add-subnet vpc1 host-subnet 10.0.3.1/32 --type private
+HOST_SUBNET_IP=$(sudo python3 -c "import json; state = json.load(open('/tmp/vpcctl_state.json')); print(state['vpcs']['vpc1']['subnets']['host-subnet']['ip'])" 2>/dev/null || echo "")
+if [ "$HOST_SUBNET_IP" = "10.0.3.1" ]; then
+    log "✓ /32 subnet created with correct address"
+else
+    error "✗ /32 subnet address incorrect (got '$HOST_SUBNET_IP', expected 10.0.3.1)"
+fi
+sleep 1
+
 # Test 3: Deploy applications
 log "Step 4: Deploying web server in public subnet"
 sudo python3 $VPCCTL deploy-app vpc1 public-subnet --port 8000